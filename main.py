@@ -1,12 +1,85 @@
 from PIL import Image, ImageDraw
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
+import functools
+import numpy as np
 import os
 
-from utils import colors
+from utils import colors, png
 from utils.paths import ASSETS_DIR, OUTPUT_DIR
 
 
+# The zlib compression level used when saving the lego image. The PNG default of 6 is far slower on images this large for little size benefit
+PNG_COMPRESS_LEVEL = 1
+
+# The most memory, in bytes, used by each band of the lego image whilst it is being built and written
+MAX_BAND_BYTES = 64 * 1024 * 1024
+
+
+@functools.lru_cache(maxsize=8)
+def _legotext_for(radius:int) -> Image.Image:
+    """ Loads the lego text image, rotated and resized to fit on a stud of the given radius. \n
+    The result is cached, so the text is only read from disk and transformed once per radius.
+
+    :param radius: The radius of the stud, in pixels.
+    :type radius: int
+    :return: The text image to be placed on the stud.
+    :rtype: PIL.Image
+    """
+    text = Image.open(ASSETS_DIR / "img" / "legotext.png").rotate(15, expand=True)
+    
+    diameter = radius * 2
+    inset = diameter / 5
+    new_x = inset * 2
+    
+    return text.resize((int(new_x), int((1 / (text.size[0] / new_x)) * text.size[1])), Image.Resampling.LANCZOS)
+
+
+@functools.lru_cache(maxsize=8)
+def _build_stud_layers(diameter:int) -> np.ndarray:
+    """ Rasterizes the three circles that make up a stud into a single map of which layer is on top at each pixel. \n
+    The geometry of a stud only depends on its diameter, so the map is shared between every stud color.
+
+    :param diameter: The diameter of the stud, in pixels.
+    :type diameter: int
+    :return: A (diameter, diameter) uint8 array, where 0 is outside the stud, 1 is the main color circle,
+        2 is the black inset circle and 3 is the darker inset circle.
+    :rtype: np.ndarray
+    """
+    
+    inset = diameter / 6
+    difference = diameter / 15
+    black_bounds = [inset+difference, inset+difference, diameter-inset+difference, diameter-inset+difference]
+    
+    inset = diameter / 5
+    darker_bounds = [inset, inset, diameter-inset, diameter-inset]
+    
+    layers_image = Image.new("L", (diameter, diameter), color = 0)
+    draw = ImageDraw.Draw(layers_image)
+    
+    # Each circle is drawn over the last, in the same order as the stud is drawn
+    for layer, bounds in enumerate(([0, 0, diameter, diameter], black_bounds, darker_bounds), start = 1):
+        draw.ellipse(bounds, fill = layer)
+    
+    return np.asarray(layers_image)
+
+
+def _replace_color_key(color:colors.Color|str) -> colors.Color:
+    """ Converts a key of the color_replace option to a Color. \n
+    Keys used to be matched by `str(color)`, so a string in that "r,g,b,a" format is still accepted.
+
+    :param color: The color to replace, as a Color or as its string representation.
+    :type color: colors.Color | str
+    :return: The color to replace.
+    :rtype: colors.Color
+    """
+    
+    if isinstance(color, str):
+        return colors.Color(tuple(float(component) for component in color.split(",")))
+    return color
+
+
 class Stud():
     """ Represents a LEGO-like stud with customizable color, radius, and optional text image.
 
@@ -15,6 +88,8 @@ class Stud():
     The stud's color is stored as a `colors.Color` object, and its image is generated and drawn based on the specified attributes.
     """
     
+    __slots__ = ("color", "radius", "text_image", "empty", "uses", "image", "key")
+    
     def __init__(self, color:colors.Color, radius:int, text_image:Image = None):
         """ Initializes a Stud object with a given color, radius, and optional text image.
 
@@ -32,16 +107,11 @@ class Stud():
         
         self.empty = self.color.alpha == 0
         self.uses:int = 0
+        
+        # The stud color packed into a single RGBA integer, identifying studs that look the same
+        self.key:int = self.color.key
 
         self.image:Image = Image.new("RGBA", (self.diameter, self.diameter), color = colors.TRANSPARENT.rgb255)
-        self.draw = ImageDraw.Draw(self.image)
-    
-    def __del__(self):
-        """ Cleans up the resources used by the Stud object. \n
-        This method ensures that memory is freed when the Stud object is deleted.
-        """
-        del self.image
-        del self.draw
     
     @property
     def diameter(self) -> int:
@@ -73,24 +143,26 @@ class Stud():
         if self.empty:
             return False
         
-        self.draw.ellipse([0, 0, self.diameter, self.diameter], fill = self.color.rgb255)
+        darker = self.color.copy().darken(0.3)
+        layer_colors = np.array([colors.TRANSPARENT.rgb255, self.color.rgb255, colors.BLACK.rgb255, darker.rgb255], dtype=np.uint8)
         
-        inset = self.diameter / 6
-        difference = self.diameter / 15
+        # Composed as an array by looking up the color of each pixel's layer, and only turned back into an image once finished
+        stud = layer_colors[_build_stud_layers(self.diameter)]
         
-        self.draw.ellipse([inset+difference, inset+difference, self.diameter-inset+difference, self.diameter-inset+difference], fill = colors.BLACK.rgb255)
+        if self.text_image is None:
+            self.text_image = _legotext_for(self.radius)
         
-        inset = self.diameter / 5
-        darker = self.color.copy().darken(0.3)
+        text = np.asarray(self.text_image.convert("RGBA"), dtype=np.uint32)
+        text_height, text_width = text.shape[:2]
+        left, top = int(self.radius - (text_width / 2)), int(self.radius - (text_height / 2))
         
-        self.draw.ellipse([inset, inset, self.diameter-inset, self.diameter-inset], fill = darker.rgb255)
+        # Blend the text over the stud using its alpha, rounding the same way as PIL.Image.paste
+        region = stud[top:top+text_height, left:left+text_width].astype(np.uint32)
+        mask = text[..., 3:]
+        blended = region * (255 - mask) + text * mask + 128
+        stud[top:top+text_height, left:left+text_width] = ((blended >> 8) + blended) >> 8
         
-        if self.text_image is None:
-            self.text_image = self.image_parent.open("assets/img/legotext.png").rotate(15, expand=True)
-            new_x = inset * 2
-            self.text_image = self.text_image.resize(int(new_x), int((1 / (self.text_image.size[0] / new_x)) * self.text_image.size[1]), Image.Resampling.LANCZOS)
-    
-        self.image.paste(self.text_image, (int(self.radius - (self.text_image.size[0] / 2)), int(self.radius - (self.text_image.size[1] / 2))), self.text_image)
+        self.image = Image.fromarray(stud, "RGBA")
 
         return True
 
@@ -126,7 +198,7 @@ class PixelMap(object):
                 self.limit_to_lego_only:bool = limit_to_lego_only
                 
                 self.replace_colors:bool = len(color_replace) and not limit_to_lego_only
-                self.replace_colors_dict:dict = color_replace if not limit_to_lego_only else {}
+                self.replace_colors_dict:dict[colors.Color, colors.Color] = {_replace_color_key(color): replacement for color, replacement in color_replace.items()} if not limit_to_lego_only else {}
                 
                 self.reduce_color:bool = reduce_color > 0
                 self.reduce_color_layers:int = reduce_color
@@ -137,12 +209,14 @@ class PixelMap(object):
         self.imageName = os.path.basename(path).split(".")[0]
         self.loadImage()
 
-        self.studs = list()
-        self.pixel_map: list[list[colors.Color]] = list() # A 2 dimensional list of the colors of each pixel
+        self.studs: dict[int, Stud] = dict() # A map between a stud's packed color key and the drawn stud
+        self.pixel_map: np.ndarray = None # A 2 dimensional array of indices into image_colors, one per pixel
         self.image_colors: list[colors.Color] = list()
+        self.image_colors_rgba: np.ndarray = None # The same colors as image_colors, as a (N, 4) uint8 array
         
-        self.color_filter = dict() # A map between the image color and its closest lego color
-        self.color_filter_uses: dict[str, int] = dict() # Counts the amount of times a filtered color is used
+        self.color_filter: dict[colors.Color, colors.Color] = dict() # A map between the image color and its closest lego color
+        self.filter_lut: np.ndarray = None # The index in LEGO_COLORS_LIST of the closest lego color, for each index in image_colors
+        self.color_filter_uses: dict[colors.Color, int] = dict() # Counts the amount of times a filtered color is used
 
         self.resize(newx)
 
@@ -161,91 +235,101 @@ class PixelMap(object):
         print("Image Saved")
 
 
-    def drawStud(self, image, coords, radius, fill:colors.Color, stud_text_image = None):        
-        # Deep copy the color to preserve it in the pixel_map list whilst performing edits here
-        fill = fill.copy()
+    def makeStud(self, fill:colors.Color, radius:int, stud_text_image = None) -> Stud:
+        """ Creates the (not yet drawn) stud for a pixel color, applying the transparency and replacement options """
+        alpha = 1 if fill.alpha >= self.options.transparent_margin else 0
         
-        fill.alpha = 1 if fill.alpha >= self.options.transparent_margin else 0
+        if fill.alpha != alpha:
+            # Deep copy the color to preserve it in the image_colors list whilst performing edits here
+            fill = fill.copy()
+            fill.alpha = alpha
 
+        # The stud takes its own copy of the color, so the options' colors can be passed as they are
         if not fill.alpha and self.options.keep_removed_transparent_studs:
-            fill = self.options.transparent_color.copy()
-        
-        stud = Stud(fill, radius, stud_text_image)
-        
-        if stud in self.studs:
-            # Replace with the existing instance
-            stud = next(existing_stud for existing_stud in self.studs if existing_stud == stud)
+            fill = self.options.transparent_color
             
-        stud.make_stud_image()
-
-        if not stud.empty:
-            if self.options.replace_colors and str(fill) in self.options.replace_colors_dict:
-                fill = self.options.replace_colors_dict[str(fill)]
-
-            if self.options.limit_to_lego_only and str(fill) in self.color_filter:
-                fill = self.color_filter[str(fill)]
-
-                # get index of fill, increase by 1
-                self.color_filter_uses[str(fill)] += 1
+        if fill.alpha and self.options.replace_colors and fill in self.options.replace_colors_dict:
+            fill = self.options.replace_colors_dict[fill]
         
-        image.paste(stud.image, (coords[0], coords[1]))
+        return Stud(fill, radius, stud_text_image)
 
 
     def toMap(self):
-        for x in range(self.image_width):
-            for y in range(self.image_height):
-                pixel_color = colors.Color(
-                    colors.ColorConv.base_255_to_1(self.pixels[x,y])
-                )
-                
-                if pixel_color not in self.image_colors:
-                    self.image_colors.append(pixel_color)
-                    
-                if len(self.pixel_map) < y + 1: 
-                    self.pixel_map.append(list())
-                
-                self.pixel_map[y].append(pixel_color)
+        """ Finds the unique colors of the image and maps every pixel to its index in `image_colors` """
+        flat = self.pixels.reshape(-1, 4)
+        unique_colors, inverse = np.unique(flat, axis=0, return_inverse=True)
+        
+        # Only the unique colors are wrapped as Color objects, the pixels themselves stay as indices
+        self.image_colors_rgba = unique_colors
+        self.image_colors = [colors.Color.from_rgb255(*color) for color in unique_colors.tolist()]
+        self.pixel_map = inverse.reshape(self.image_height, self.image_width)
 
 
     def generateImage(self):
-
-        def preloadStudText(radius):
-            text = Image.open(ASSETS_DIR / "img" / "legotext.png").rotate(15, expand=True)
-            
-            diameter = radius * 2
-            inset = diameter / 5
-            new_x = inset * 2
-            
-            text = text.resize((int(new_x), int((1 / (text.size[0] / new_x)) * text.size[1])), Image.Resampling.LANCZOS)
-            return text
-
         stud_radius = self.options.stud_resolution
         stud_diameter = stud_radius * 2
-        preloaded_stud_text = preloadStudText(stud_radius)
+        preloaded_stud_text = _legotext_for(stud_radius)
 
-        new_image = Image.new("RGBA", (stud_diameter * self.image_width, stud_diameter * self.image_height), color = colors.BLACK.rgb255)
+        if self.options.limit_to_lego_only:
+            # Only the lego colors that are used need a stud, with every pixel mapped through the filter to its lego color
+            used_lego_indices, lego_to_stud = np.unique(self.filter_lut, return_inverse=True)
+            stud_colors = [colors.LEGO_COLORS_LIST[index] for index in used_lego_indices.tolist()]
+            stud_map = lego_to_stud.reshape(-1)[self.pixel_map]
+        else:
+            stud_colors = self.image_colors
+            stud_map = self.pixel_map
+        
+        # Every stud color that ends up looking the same shares a single drawn stud
+        stud_images: list[np.ndarray] = list() # The stud image pixels for each of the stud colors, indexed by stud_map
+        
+        for fill_color in stud_colors:
+            stud = self.makeStud(fill_color, stud_radius, stud_text_image = preloaded_stud_text)
+            
+            if stud.key in self.studs:
+                # Replace with the existing instance
+                stud = self.studs[stud.key]
+            else:
+                stud.make_stud_image()
+                self.studs[stud.key] = stud
+                
+            stud_images.append(np.asarray(stud.image))
+        
+        # All of the stud images stacked, so that a whole row of studs can be gathered with a single index
+        stud_tiles = np.stack(stud_images)
         
-        for y in enumerate(self.pixel_map):
-            for x in enumerate(y[1]):                
-                coords = [x[0] * stud_diameter, y[0] * stud_diameter, (x[0]+1) * stud_diameter, (y[0]+1) * stud_diameter]
+        def copyRows(band:np.ndarray, band_start:int, rows:range):
+            # The band viewed as (stud row, row within stud, stud column, column within stud, RGBA)
+            band_studs = band.reshape(-1, stud_diameter, self.image_width, stud_diameter, 4)
+            for y in rows:
+                band_studs[y - band_start] = stud_tiles[stud_map[y]].transpose(1, 0, 2, 3)
+        
+        # The image is built and written a band of stud rows at a time, so that only one band is ever held in memory
+        stud_row_bytes = stud_diameter * stud_diameter * self.image_width * 4
+        band_height = max(1, MAX_BAND_BYTES // stud_row_bytes)
+        
+        # Each thread copies a separate set of rows in the band, so they can be copied in parallel without locking
+        thread_rows = -(-band_height // (os.cpu_count() or 1))
+        
+        output_path = OUTPUT_DIR / self.imageName / f"{self.imageName}_lego{"_limit" if self.options.limit_to_lego_only else ""}.png"
+        
+        with ThreadPoolExecutor() as executor, png.PngWriter(output_path, stud_diameter * self.image_width, stud_diameter * self.image_height, PNG_COMPRESS_LEVEL) as writer:
+            for band_start in range(0, self.image_height, band_height):
+                band_end = min(band_start + band_height, self.image_height)
+                
+                # Every stud overwrites its whole square, so the band does not need to be cleared
+                band = np.empty(((band_end - band_start) * stud_diameter, stud_diameter * self.image_width, 4), dtype=np.uint8)
                 
-                fill_color = self.pixel_map[y[0]][x[0]]
-                if self.options.limit_to_lego_only:
-                    fill_color = self.color_filter[str(fill_color)]
+                thread_bands = [range(start, min(start + thread_rows, band_end)) for start in range(band_start, band_end, thread_rows)]
+                list(executor.map(lambda rows: copyRows(band, band_start, rows), thread_bands))
                 
-                self.drawStud(new_image, coords, stud_radius, fill_color, stud_text_image = preloaded_stud_text)
+                writer.write_rows(band)
         
         print("Image Generated")
 
-        new_image.save(OUTPUT_DIR / self.imageName / f"{self.imageName}_lego{"_limit" if self.options.limit_to_lego_only else ""}.png")
-
 
     def loadImage(self):
+        # The pixels are only read once the image has been resized, in resize
         self.image = Image.open(self.path)
-
-        self.reduceColor()
-
-        self.pixels = self.image.load()
         self.image_width, self.image_height = self.image.size
 
 
@@ -260,47 +344,43 @@ class PixelMap(object):
             proportion = 1 / (self.image_width / new_x)
             resize_to = (int(new_x), int(proportion * self.image_height))
 
-        self.image = self.image.resize(resize_to, Image.Resampling.LANCZOS)
+        if resize_to != self.image.size:
+            self.image = self.image.resize(resize_to, Image.Resampling.LANCZOS)
 
+        # Reduced after resizing, as resampling blends neighbouring pixels into new colors
         self.reduceColor()
 
-        self.pixels = self.image.load()
+        # The only copy of the pixels taken out of PIL, which the rest of the pipeline works on
+        self.pixels = np.asarray(self.image.convert("RGBA"), dtype=np.uint8) # Indexed as [y, x]
         self.image_width, self.image_height = self.image.size
 
 
     def generateFilter(self):
-        new_color_map:list[colors.Color] = list()
+        """ Maps every image color to its closest lego color """
+        # The alpha of the image colors is ignored, as the difference is only measured in HSL space
+        image_colors_hsl = colors.ColorConv.rgb_to_hsl_array(colors.ColorConv.base_255_to_1_array(self.image_colors_rgba[:, :3]))
+        self.filter_lut = colors.nearest_lego(image_colors_hsl)
         
-        # Set all colors alpha to 1
-        for original_color in self.image_colors:
-            new_color = original_color.copy()
-            new_color.alpha = 1
-            
-            new_color_map.append(new_color)
-
-            differences:list[float] = []
-            
-            # Get the difference value for every color in the lego set
-            for compare in colors.LEGO_COLORS_LIST:
-                differences.append(new_color.diff(compare))
-            
-            closest_color_index = differences.index(min(differences))
-            closest_color = colors.LEGO_COLORS_LIST[closest_color_index]
-            
+        for original_color, closest_color_index in zip(self.image_colors, self.filter_lut.tolist()):
             # set the color in the filter map to the color with the smallest difference value
-            self.color_filter[str(original_color)] = closest_color
-            
-            # Add the new color to the filter index list
-            if str(closest_color) not in self.color_filter_uses.keys():
-                self.color_filter_uses[str(closest_color)] = 0 # Counter for how many times this color is used
+            self.color_filter[original_color] = colors.LEGO_COLORS_LIST[closest_color_index]
+        
+        # The lego color index of every pixel, counted to get how many times each lego color is used
+        lego_map = self.filter_lut[self.pixel_map]
+        lego_color_uses = np.bincount(lego_map.ravel(), minlength=len(colors.LEGO_COLORS_LIST))
+        
+        for lego_color, uses in zip(colors.LEGO_COLORS_LIST, lego_color_uses.tolist()):
+            if uses:
+                self.color_filter_uses[lego_color] = uses
 
 
     def reduceColor(self):
         """ Reduces the amount of unique colors in the image based on the user input """
         if self.options.reduce_color:
+            # Only reduced once, after resizing, rather than both before and after it.
+            # Converting back to RGB flattens any transparency, so transparent areas still become opaque studs
             self.image = self.image.convert("P", palette=Image.Palette.ADAPTIVE, colors=self.options.reduce_color_layers)
             self.image = self.image.convert("RGB")
-            self.image.show()
 
 
 USE_DEBUG_OPTIONS = True
@@ -1,7 +1,15 @@
 from enum import Enum
 from numbers import Number
-from typing import Iterable, Tuple
-import copy, math
+from typing import Callable, Iterable, Tuple
+import functools, math
+
+import numpy as np
+
+# Every 8-bit value normalized between 0 and 1, indexed by the 8-bit value
+_Q255: tuple[float, ...] = tuple(i / 255 for i in range(256))
+
+# The two digit lowercase hex code of every 8-bit value
+_HEX_PAIRS: tuple[str, ...] = tuple(f"{i:02x}" for i in range(256))
 
 class ColorConv():
     """
@@ -14,11 +22,13 @@ class ColorConv():
     """
     
     @staticmethod
+    @functools.lru_cache(maxsize=1 << 16, typed=True)
     def rgb_to_hsl(r:float, g:float, b:float) -> tuple[float, float, float]:
         """ Converts an RGB color to HSL (Hue, Saturation, Lightness), where the input and output colors are normalized between 0 and 1.
         - Uses normalized RGB values (0 to 1) instead of 0-255.
         - The Hue wraps around if negative to stay within [0,1].
         - An achromatic color (where r = g = b) results in a saturation of 0.
+        - Results are cached, as `Color` keeps its components at 8-bit precision so the same inputs repeat often.
 
         :param r: Red component, normalized (0 ≤ r ≤ 1)
         :type r: float
@@ -52,26 +62,23 @@ class ColorConv():
             else:
                 s = delta / (2.0 - cmax - cmin)
             
-            # Calculate Hue
-            if cmax == r:
-                h = (g - b) / delta
-            elif cmax == g:
-                h = (b - r) / delta + 2
-            elif cmax == b:
-                h = (r - g) / delta + 4
+            # Calculate Hue, from whichever component is the largest
+            largest = 0 if cmax == r else (1 if cmax == g else 2)
+            numerator, offset = ((g - b, 0), (b - r, 2), (r - g, 4))[largest]
             
             # Ensure the Hue is between 0 and 1
-            h /= 6
+            h = (numerator / delta + offset) / 6
             
             # If hue is negative, wrap it around by adding 1
-            if h < 0:
-                h += 1
+            h -= math.floor(h)
     
         return (h, s, l)
 
     @staticmethod
+    @functools.lru_cache(maxsize=1 << 16, typed=True)
     def hsl_to_rgb(h:float, s:float, l:float) -> tuple[float, float, float]:
         """ Converts an HSL color to RGB, where the input and output colors are normalized between 0 and 1
+        - Results are cached, the same as `rgb_to_hsl`.
 
         :param h: Hue, normalized (0 ≤ h ≤ 1), where 0 and 1 represent red.
         :type h: float
@@ -118,6 +125,86 @@ class ColorConv():
         # Return RGB values between 0 and 1
         return (r, g, b)
 
+    @staticmethod
+    def rgb_to_hsl_array(rgb:np.ndarray) -> np.ndarray:
+        """ Converts an array of RGB colors to HSL, the same as `rgb_to_hsl` but for every color at once.
+        - Takes any shape with a last dimension of 3, eg (N, 3) or (H, W, 3).
+        - Gives exactly the same values as `rgb_to_hsl` does for each color.
+
+        :param rgb: The RGB colors, each component normalized between 0 and 1.
+        :type rgb: np.ndarray
+        
+        :return: The HSL colors, in the same shape as the input, each component normalized between 0 and 1.
+        :rtype: np.ndarray
+        """
+        
+        rgb = np.asarray(rgb, dtype=np.float64)
+        r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+        
+        cmax = rgb.max(axis=-1)
+        cmin = rgb.min(axis=-1)
+        delta = cmax - cmin
+        
+        l = (cmax + cmin) / 2
+        
+        # Achromatic colors (delta of 0) have a hue and saturation of 0, so their divisors are replaced to avoid dividing by 0
+        chromatic = delta != 0
+        safe_delta = np.where(chromatic, delta, 1)
+        
+        s = np.where(
+            l < 0.5,
+            delta / np.where(chromatic, cmax + cmin, 1),
+            delta / np.where(chromatic, 2.0 - cmax - cmin, 1)
+        )
+        
+        h = np.select(
+            [cmax == r, cmax == g],
+            [(g - b) / safe_delta, (b - r) / safe_delta + 2],
+            (r - g) / safe_delta + 4
+        )
+        
+        h /= 6
+        h = np.where(h < 0, h + 1, h)
+        h = np.where(chromatic, h, 0)
+        
+        return np.stack((h, s, l), axis=-1)
+
+    @staticmethod
+    def hsl_to_rgb_array(hsl:np.ndarray) -> np.ndarray:
+        """ Converts an array of HSL colors to RGB, the same as `hsl_to_rgb` but for every color at once.
+        - Takes any shape with a last dimension of 3, eg (N, 3) or (H, W, 3).
+        - Gives exactly the same values as `hsl_to_rgb` does for each color.
+
+        :param hsl: The HSL colors, each component normalized between 0 and 1.
+        :type hsl: np.ndarray
+        
+        :return: The RGB colors, in the same shape as the input, each component normalized between 0 and 1.
+        :rtype: np.ndarray
+        """
+        
+        hsl = np.asarray(hsl, dtype=np.float64)
+        h, s, l = hsl[..., 0], hsl[..., 1], hsl[..., 2]
+        
+        c = (1 - np.abs(2 * l - 1)) * s
+        x = c * (1 - np.abs(((h * 6) % 2) - 1))
+        m = l - c / 2
+        zero = np.zeros_like(c)
+        
+        # The hue sextant each color falls in, the last sextant also covering any hue outside of 0 to 1
+        sextants = [
+            (0 <= h) & (h < 1 / 6),
+            (1 / 6 <= h) & (h < 2 / 6),
+            (2 / 6 <= h) & (h < 3 / 6),
+            (3 / 6 <= h) & (h < 4 / 6),
+            (4 / 6 <= h) & (h < 5 / 6),
+        ]
+        
+        r_prime = np.select(sextants, [c, x, zero, zero, x], c)
+        g_prime = np.select(sextants, [x, c, c, x, zero], zero)
+        b_prime = np.select(sextants, [zero, zero, x, c, c], x)
+        
+        return np.stack((r_prime + m, g_prime + m, b_prime + m), axis=-1)
+
     @staticmethod
     def rgb_to_hex(r: float, g: float, b: float, a: float = None) -> str:
         """ Converts an RGB color to a hex code, where the input components are normalized between 0 and 1.
@@ -131,19 +218,23 @@ class ColorConv():
         :type g: float
         :param b: Blue component, normalized (0 ≤ b ≤ 1)
         :type b: float
-        :param b: Optional alpha component, normalized (0 ≤ b ≤ 1), defaults to None
-        :type b: float, optional
+        :param a: Optional alpha component, normalized (0 ≤ a ≤ 1), defaults to None
+        :type a: float, optional
         
         :return: The hexadecimal representation, either 6 or 8 characters long, including a hashtag
         :rtype: str
+        
+        :raises AssertionError: If any of the components are out of bounds.
         """
-        r, g, b = ColorConv.base_1_to_255((r, g, b))
+        assert 0 <= r <= 1 and 0 <= g <= 1 and 0 <= b <= 1, "RGB values must be between 0 and 1"
+        
+        hex_value = "#" + _HEX_PAIRS[round(r * 255)] + _HEX_PAIRS[round(g * 255)] + _HEX_PAIRS[round(b * 255)]
         
         if a is not None:
-            a = a * 255
-            return f"#{r:02x}{g:02x}{b:02x}{a:02x}"
+            assert 0 <= a <= 1, "Alpha value must be between 0 and 1"
+            return hex_value + _HEX_PAIRS[round(a * 255)]
         
-        return f"#{r:02x}{g:02x}{b:02x}"
+        return hex_value
 
     @staticmethod
     def hex_to_rgb(hex_value: str) -> tuple[float, float, float, float]:
@@ -162,17 +253,16 @@ class ColorConv():
         if len(hex_value) not in [6, 8]:
             raise ValueError("HEX color should be in the format #RRGGBB, RRGGBB, #RRGGBBAA or RRGGBBAA")
 
-        # Extract RGB components as 8-bit values
-        r = int(hex_value[0:2], 16)
-        g = int(hex_value[2:4], 16)
-        b = int(hex_value[4:6], 16)
+        # Parse the whole value once, then extract the components as 8-bit values
+        value = int(hex_value, 16)
         
         if len(hex_value) == 8:
-            a = int(hex_value[6:8], 16)
+            a = value & 0xff
+            value >>= 8
         else:
-            a = 1
+            a = 255
         
-        return ColorConv.base_255_to_1((r, g, b, a))
+        return ((value >> 16) & 0xff) / 255, ((value >> 8) & 0xff) / 255, (value & 0xff) / 255, a / 255
 
 
     @staticmethod
@@ -185,7 +275,19 @@ class ColorConv():
         :rtype: Tuple[float, ...]
         """
         
-        return tuple(map(lambda x: x / 255, color_iterable))
+        return tuple([x / 255 for x in color_iterable])
+
+    @staticmethod
+    def base_255_to_1_array(colors:np.ndarray) -> np.ndarray:
+        """ Converts an array of 8-bit color values to the normalized 0-1 range, the same as `base_255_to_1` but for every value at once.
+
+        :param colors: An array of any shape of 8-bit integer color values (0 ≤ x ≤ 255)
+        :type colors: np.ndarray
+        :return: A float array of the same shape of normalized color values (0 ≤ x ≤ 1)
+        :rtype: np.ndarray
+        """
+        
+        return np.asarray(colors, dtype=np.float64) / 255
 
     @staticmethod
     def base_1_to_255(color_iterable: Iterable[float]) -> Tuple[int, ...]:
@@ -197,7 +299,7 @@ class ColorConv():
         :rtype: Tuple[int, ...]
         """
         
-        return tuple(map(lambda x: round(x * 255), color_iterable))
+        return tuple([round(x * 255) for x in color_iterable])
 
     @staticmethod
     def clamp_to_255_res(color_iterable: Iterable[float]) -> Tuple[float, ...]:
@@ -210,7 +312,26 @@ class ColorConv():
         :rtype: Tuple[float, ...]
         """
         
-        return tuple(map(lambda x: round(x * 255) / 255, color_iterable))
+        return tuple([round(x * 255) / 255 for x in color_iterable])
+
+    @staticmethod
+    def clamp_rgba_to_255_res(r:float, g:float, b:float, a:float) -> tuple[float, float, float, float]:
+        """ The same as `clamp_to_255_res`, for exactly the 4 components of a color.
+        Unrolled, as it is called on every change to a color.
+
+        :param r: Red component, normalized (0 ≤ r ≤ 1)
+        :type r: float
+        :param g: Green component, normalized (0 ≤ g ≤ 1)
+        :type g: float
+        :param b: Blue component, normalized (0 ≤ b ≤ 1)
+        :type b: float
+        :param a: Alpha component, normalized (0 ≤ a ≤ 1)
+        :type a: float
+        :return: The components, rounded to the nearest 1/255 step.
+        :rtype: tuple[float, float, float, float]
+        """
+        
+        return round(r * 255) / 255, round(g * 255) / 255, round(b * 255) / 255, round(a * 255) / 255
 
 
 class ColorMode(Enum):
@@ -221,6 +342,33 @@ class ColorMode(Enum):
     HEX = 4
 
 
+@functools.lru_cache(maxsize=1 << 16)
+def _change_lightness(key:int, amount:float, darken:bool) -> tuple[float, float, float, float]:
+    """ Darkens or lightens a color in HSL space, the result being cached for each color, amount and direction.
+
+    :param key: The packed RGBA integer of the color, as given by `Color.key`.
+    :type key: int
+    :param amount: The amount to darken or lighten the color by (0 ≤ amount ≤ 1).
+    :type amount: float
+    :param darken: True to darken the color towards black, False to lighten it towards white.
+    :type darken: bool
+    
+    :return: The changed color in normalized RGB format, including alpha.
+    :rtype: tuple[float, float, float, float]
+    """
+    
+    color = Color.from_rgb255((key >> 24) & 0xff, (key >> 16) & 0xff, (key >> 8) & 0xff, key & 0xff)
+    h, s, l, a = color.hsl  # Get current HSL values
+    
+    if darken:
+        new_l = max(0, l - (l * amount))  # Decrease lightness toward 0 (black)
+    else:
+        new_l = min(1, l + ((1 - l) * amount))  # Increase lightness toward 1 (white)
+    
+    _hsl_fset(color, (h, s, new_l, a))  # Update color with the new lightness value
+    return color.rgb
+
+
 class Color():
     """ A class for handling colors with both RGB and HSL representations, supporting conversions, clamping, and basic color manipulations.
 
@@ -232,6 +380,8 @@ class Color():
     - Color difference measurement in HSL space.
     """
     
+    __slots__ = ("__r", "__g", "__b", "__a", "__key", "__hsl")
+    
     def __init__(self, initial:Iterable[Number]|str = None, _as:ColorMode = ColorMode.RGB):
         """
         :param initial: Initial color value, as an iterable of float color values, defaults to None
@@ -246,23 +396,54 @@ class Color():
         self.__b: float = 0.0
         self.__a: float = 1.0 
         
+        # The packed RGBA integer of the color, computed when first needed
+        self.__key: int = None
+        
+        # The HSL components of the color, computed when first needed
+        self.__hsl: tuple[float, float, float] = None
+        
         if initial is not None:
             if isinstance(initial, __class__):
-                self = initial
+                # Copies the components of the other color, which are already valid
+                self.__r, self.__g, self.__b, self.__a = initial.__r, initial.__g, initial.__b, initial.__a
+                self.__key = initial.__key
+                self.__hsl = initial.__hsl
             
             elif isinstance(initial, str) and _as == ColorMode.HEX:
                 # If the input is a HEX color
                 self.hex = initial
                 
             elif isinstance(initial, (list, tuple)) and 2 < len(initial) < 5:
-                if _as == ColorMode.RGB:
-                    self.rgb = initial
-                elif _as == ColorMode.HSL:
-                    self.hsl = initial
-                elif _as == ColorMode.RGB255:
-                    self.rgb = ColorConv.base_255_to_1(initial)
-                elif _as == ColorMode.HSL255:
-                    self.hsl = ColorConv.base_255_to_1(initial)
+                setter = _ITERABLE_SETTERS.get(_as)
+                if setter is not None:
+                    setter(self, initial)
+
+    @classmethod
+    def from_rgb255(cls, r:int, g:int, b:int, a:int = 255) -> "Color":
+        """ Creates a color from 8-bit (0-255) RGBA integers, such as the pixels of an image.
+        Skips the validation and clamping of the `rgb` setter, as every 8-bit integer is already an exact 8-bit color,
+        so the components must be integers between 0 and 255.
+
+        :param r: Red component (0 ≤ r ≤ 255)
+        :type r: int
+        :param g: Green component (0 ≤ g ≤ 255)
+        :type g: int
+        :param b: Blue component (0 ≤ b ≤ 255)
+        :type b: int
+        :param a: Alpha component (0 ≤ a ≤ 255), defaults to 255
+        :type a: int, optional
+        
+        :return: The new color.
+        :rtype: Color
+        """
+        # Python ints, so that the packed key can't overflow if NumPy integers are given
+        r, g, b, a = int(r), int(g), int(b), int(a)
+        
+        color = cls.__new__(cls)
+        color.__r, color.__g, color.__b, color.__a = _Q255[r], _Q255[g], _Q255[b], _Q255[a]
+        color.__key = (r << 24) | (g << 16) | (b << 8) | a
+        color.__hsl = None
+        return color
 
     @property
     def rgb(self) -> tuple[float, float, float, float]:
@@ -280,7 +461,7 @@ class Color():
         :return: A tuple representing the RGB values (r, g, b, alpha) where each component is between 0 and 255.
         :rtype: tuple[int, int, int, int]
         """
-        return ColorConv.base_1_to_255((self.__r, self.__g, self.__b, self.__a))
+        return round(self.__r * 255), round(self.__g * 255), round(self.__b * 255), round(self.__a * 255)
     
     @rgb.setter
     def rgb(self, value: Tuple[float, ...]):
@@ -298,18 +479,22 @@ class Color():
             assert 0 <= value[3] <= 1, "Alpha value must be between 0 and 1"
             self.__a = value[3]
         
-        self.__r, self.__g, self.__b, self.__a = ColorConv.clamp_to_255_res(list(value[:3]) + [self.__a])
+        self.__r, self.__g, self.__b, self.__a = ColorConv.clamp_rgba_to_255_res(value[0], value[1], value[2], self.__a)
+        self.__key = None
+        self.__hsl = None
 
 
     @property
     def hsl(self) -> tuple[float, float, float, float]:
         """ Returns the color in normalized HSL format (0 to 1).
+        The HSL components are cached until any of the RGB components are changed.
 
         :return: A tuple representing the HSL values (h, s, l, alpha) where each component is between 0 and 1.
         :rtype: tuple[float, float, float, float]
         """
-        h, s, l = ColorConv.rgb_to_hsl(*self.rgb[:3])
-        return h, s, l, self.__a
+        if self.__hsl is None:
+            self.__hsl = ColorConv.rgb_to_hsl(self.__r, self.__g, self.__b)
+        return *self.__hsl, self.__a
     
     @property
     def hsl255(self) -> tuple[float, float, float, float]:
@@ -318,8 +503,7 @@ class Color():
         :return: A tuple representing the HSL values (h, s, l, alpha) where each component is between 0 and 255.
         :rtype: tuple[int, int, int, int]
         """
-        h, s, l = ColorConv.rgb_to_hsl(*self.rgb[:3])
-        return ColorConv.base_1_to_255((h, s, l, self.__a))
+        return ColorConv.base_1_to_255(self.hsl)
     
     @hsl.setter
     def hsl(self, value: Tuple[float, ...]):
@@ -337,7 +521,10 @@ class Color():
             assert 0 <= value[3] <= 1, "Alpha value must be between 0 and 1"
             self.__a = value[3]
             
-        self.__r, self.__g, self.__b, self.__a = ColorConv.clamp_to_255_res(list(ColorConv.hsl_to_rgb(*value[:3])) + [self.__a])
+        r, g, b = ColorConv.hsl_to_rgb(value[0], value[1], value[2])
+        self.__r, self.__g, self.__b, self.__a = ColorConv.clamp_rgba_to_255_res(r, g, b, self.__a)
+        self.__key = None
+        self.__hsl = None
 
     @property
     def hex(self) -> str:
@@ -355,6 +542,20 @@ class Color():
         self.rgb = ColorConv.hex_to_rgb(value)
 
 
+    @property
+    def key(self) -> int:
+        """ Returns the color packed into a single RGBA integer, used to hash the color.
+        The packed value is cached until any of the color components are changed.
+
+        :return: The 8-bit RGBA components packed as 0xRRGGBBAA.
+        :rtype: int
+        """
+        if self.__key is None:
+            r, g, b, a = self.rgb255
+            self.__key = (r << 24) | (g << 16) | (b << 8) | a
+        return self.__key
+
+
     @property
     def r(self) -> float:
         """ Returns the red component of the color in normalized RGB format.
@@ -375,6 +576,8 @@ class Color():
         """
         assert 0 <= value <= 1, "Red value must be between 0 and 1"
         self.__r = round(value * 255) / 255
+        self.__key = None
+        self.__hsl = None
     
     @property
     def g(self) -> float:
@@ -396,6 +599,8 @@ class Color():
         """
         assert 0 <= value <= 1, "Green value must be between 0 and 1"
         self.__g = round(value * 255) / 255
+        self.__key = None
+        self.__hsl = None
     
     @property
     def b(self) -> float:
@@ -417,6 +622,8 @@ class Color():
         """
         assert 0 <= value <= 1, "Blue value must be between 0 and 1"
         self.__b = round(value * 255) / 255
+        self.__key = None
+        self.__hsl = None
     
     
     @property
@@ -439,7 +646,7 @@ class Color():
         """
         assert 0 <= value <= 1, "Hue value must be between 0 and 1"
         hsl = self.hsl  # cache value
-        self.rgb = ColorConv.hsl_to_rgb(value, hsl[1], hsl[2])
+        _hsl_fset(self, (value, hsl[1], hsl[2]))
     
     @property
     def s(self) -> float:
@@ -461,7 +668,7 @@ class Color():
         """
         assert 0 <= value <= 1, "Saturation value must be between 0 and 1"
         hsl = self.hsl  # cache value
-        self.rgb = ColorConv.hsl_to_rgb(hsl[0], value, hsl[2])
+        _hsl_fset(self, (hsl[0], value, hsl[2]))
     
     @property
     def l(self) -> float:
@@ -483,7 +690,7 @@ class Color():
         """
         assert 0 <= value <= 1, "Lightness value must be between 0 and 1"
         hsl = self.hsl  # cache value
-        self.rgb = ColorConv.hsl_to_rgb(hsl[0], hsl[1], value)
+        _hsl_fset(self, (hsl[0], hsl[1], value))
     
     
     @property
@@ -506,6 +713,7 @@ class Color():
         """
         assert 0 <= value <= 1, "Alpha value must be between 0 and 1"
         self.__a = round(value * 255) / 255
+        self.__key = None
 
 
     def darken(self, amount: float) -> "Color":
@@ -513,7 +721,7 @@ class Color():
 
         Decreases the lightness value of the color, making it darker. The amount parameter controls
         how much the color is darkened. A value of 0 means no change, and a value of 1 will make
-        the color completely black.
+        the color completely black. The result is cached for each color and amount.
 
         :param amount: A float representing the amount to darken the color (0 ≤ amount ≤ 1).
         :type amount: float
@@ -527,9 +735,7 @@ class Color():
         assert 0 <= amount <= 1, \
             "Amount must be between 0 and 1"
         
-        h, s, l, a = self.hsl  # Get current HSL values
-        new_l = max(0, l - (l * amount))  # Decrease lightness toward 0 (black)
-        self.hsl = h, s, new_l, a  # Update color with the new lightness value
+        _rgb_fset(self, _change_lightness(self.key, amount, True))
         return self
 
     def lighten(self, amount: float) -> "Color":
@@ -537,7 +743,7 @@ class Color():
 
         Increases the lightness value of the color, making it lighter. The amount parameter controls
         how much the color is lightened. A value of 0 means no change, and a value of 1 will make
-        the color completely white.
+        the color completely white. The result is cached for each color and amount.
 
         :param amount: A float representing the amount to lighten the color (0 ≤ amount ≤ 1).
         :type amount: float
@@ -551,19 +757,22 @@ class Color():
         assert 0 <= amount <= 1, \
             "Amount must be between 0 and 1"
         
-        h, s, l, a = self.hsl  # Get current HSL values
-        new_l = min(1, l + ((1 - l) * amount))  # Increase lightness toward 1 (white)
-        self.hsl = h, s, new_l, a  # Update color with the new lightness value
+        _rgb_fset(self, _change_lightness(self.key, amount, False))
         return self
 
 
     def copy(self) -> "Color":
-        """ Creates and returns a deep copy of the current color object.
+        """ Creates and returns a copy of the current color object.
+        The components are copied directly, skipping the validation in `__init__` as they are already valid.
 
         :return: A new `Color` object that is a copy of the current instance.
         :rtype: Color
         """
-        return copy.deepcopy(self)
+        color = __class__.__new__(__class__)
+        color.__r, color.__g, color.__b, color.__a = self.__r, self.__g, self.__b, self.__a
+        color.__key = self.__key
+        color.__hsl = self.__hsl
+        return color
     
     
     def diff(self, compare: "Color") -> float:
@@ -583,16 +792,33 @@ class Color():
         :raises AssertionError: If the comparison object is not of the `Color` class.
         """
         
+        return math.sqrt(self.diff_sq(compare))
+    
+    def diff_sq(self, compare: "Color") -> float:
+        """ Calculates the squared difference between this and another color as a float
+        
+        The same as `diff` without the square root, which keeps the same ordering, so it can be used
+        instead of `diff` when finding the closest color.
+
+        :param compare: The color to compare with.
+        :type compare: Color
+        
+        :return: A float representing the squared Euclidean distance between the two colors.
+        :rtype: float
+        
+        :raises AssertionError: If the comparison object is not of the `Color` class.
+        """
+        
         assert isinstance(compare, __class__), "Invalid class comparison"
 
         h1, s1, l1, _ = self.hsl
         h2, s2, l2, _ = compare.hsl
 
-        return math.sqrt(
-            ((h1 - h2) ** 2) * 2 + # bias towards hue
-             (s1 - s2) ** 2 +
-            (l1 - l2) ** 2
-        )
+        dh = h1 - h2
+        ds = s1 - s2
+        dl = l1 - l2
+
+        return dh * dh * 2 + ds * ds + dl * dl # bias towards hue
     
     
     def __str__(self):
@@ -621,12 +847,13 @@ class Color():
         :return: An iterator over the RGB components and alpha value of the color.
         :rtype: iter
         """
-        return iter([self.__r, self.__g, self.__b, self.__a])
+        return iter((self.__r, self.__g, self.__b, self.__a))
     
     def __eq__(self, compare: "Color"):
         """ Checks if the current color is equal to another color.
 
-        This method compares the RGBA values of the two colors to determine equality.
+        This method compares the packed RGBA integers of the two colors to determine equality.
+        The components are always stored at 8-bit precision, so this is the same as comparing the RGBA values.
 
         :param compare: The color to compare with.
         :type compare: Color
@@ -635,8 +862,29 @@ class Color():
         :rtype: bool
         """
         if isinstance(compare, __class__):
-            return self.rgb == compare.rgb
+            return self.key == compare.key
         return
+    
+    def __hash__(self) -> int:
+        """ Returns the hash of the color, which is its packed RGBA integer.
+        
+        :return: The packed RGBA integer of the color.
+        :rtype: int
+        """
+        return self.key
+
+
+# The rgb and hsl property setters, so that the hottest methods can call them without looking up the property each time
+_rgb_fset: Callable[[Color, Tuple[float, ...]], None] = Color.rgb.fset
+_hsl_fset: Callable[[Color, Tuple[float, ...]], None] = Color.hsl.fset
+
+# The function used by `Color.__init__` to set the color from an initial iterable, for each color mode
+_ITERABLE_SETTERS: dict[ColorMode, Callable[[Color, Iterable[Number]], None]] = {
+    ColorMode.RGB: _rgb_fset,
+    ColorMode.HSL: _hsl_fset,
+    ColorMode.RGB255: lambda color, value: _rgb_fset(color, ColorConv.base_255_to_1(value)),
+    ColorMode.HSL255: lambda color, value: _hsl_fset(color, ColorConv.base_255_to_1(value)),
+}
 
 
 TRANSPARENT:Color = Color((0, 0, 0, 0))
@@ -822,49 +1070,37 @@ LEGO_COLORS_DICT = {
 }
 
 
-LEGO_COLORS_LIST = [
-    Color((255, 255, 255), _as = ColorMode.RGB255),
-    Color((221, 222, 221), _as = ColorMode.RGB255),
-    Color((217, 187, 123), _as = ColorMode.RGB255),
-    Color((214, 114, 64), _as = ColorMode.RGB255),
-    Color((255, 0, 0), _as = ColorMode.RGB255),
-    Color((0, 0, 255), _as = ColorMode.RGB255),
-    Color((255, 255, 0), _as = ColorMode.RGB255),
-    Color((0, 0, 0), _as = ColorMode.RGB255),
-    Color((0, 153, 0), _as = ColorMode.RGB255),
-    Color((0, 204, 0), _as = ColorMode.RGB255),
-    Color((168, 61, 21), _as = ColorMode.RGB255),
-    Color((71, 140, 198), _as = ColorMode.RGB255),
-    Color((255, 102, 0), _as = ColorMode.RGB255),
-    Color((5, 157, 158), _as = ColorMode.RGB255),
-    Color((149, 185, 11), _as = ColorMode.RGB255),
-    Color((153, 0, 102), _as = ColorMode.RGB255),
-    Color((94, 116, 140), _as = ColorMode.RGB255),
-    Color((141, 116, 82), _as = ColorMode.RGB255),
-    Color((0, 37, 65), _as = ColorMode.RGB255),
-    Color((0, 51, 0), _as = ColorMode.RGB255),
-    Color((95, 130, 101), _as = ColorMode.RGB255),
-    Color((128, 8, 27), _as = ColorMode.RGB255),
-    Color((244, 155, 0), _as = ColorMode.RGB255),
-    Color((91, 28, 12), _as = ColorMode.RGB255),
-    Color((156, 146, 145), _as = ColorMode.RGB255),
-    Color((76, 81, 86), _as = ColorMode.RGB255),
-    Color((228, 228, 218), _as = ColorMode.RGB255),
-    Color((135, 192, 234), _as = ColorMode.RGB255),
-    Color((222, 55, 139), _as = ColorMode.RGB255),
-    Color((238, 157, 195), _as = ColorMode.RGB255),
-    Color((255, 255, 153), _as = ColorMode.RGB255),
-    Color((44, 21, 119), _as = ColorMode.RGB255),
-    Color((245, 193, 137), _as = ColorMode.RGB255),
-    Color((48, 15, 6), _as = ColorMode.RGB255),
-    Color((170, 125, 85), _as = ColorMode.RGB255),
-    Color((70, 155, 195), _as = ColorMode.RGB255),
-    Color((104, 195, 226), _as = ColorMode.RGB255),
-    Color((211, 242, 234), _as = ColorMode.RGB255),
-    Color((160, 110, 185), _as = ColorMode.RGB255),
-    Color((205, 164, 222), _as = ColorMode.RGB255),
-    Color((245, 243, 215), _as = ColorMode.RGB255),
-    Color((226, 249, 154), _as = ColorMode.RGB255),
-    Color((119, 119, 78), _as = ColorMode.RGB255),
-    Color((150, 185, 59), _as = ColorMode.RGB255),
-]
\ No newline at end of file
+# The lego colors in the same order as LEGO_COLORS_DICT, as new opaque colors so that the two can't drift apart
+LEGO_COLORS_LIST:tuple[Color, ...] = tuple(Color.from_rgb255(*color.rgb255[:3]) for _, color in LEGO_COLORS_DICT.values())
+
+
+# The HSL values of every lego color as a (N, 3) array, so that many colors can be compared against the lego set at once
+LEGO_COLORS_HSL:np.ndarray = np.array([color.hsl[:3] for color in LEGO_COLORS_LIST])
+
+# The weight of each HSL component when comparing colors, matching the hue bias of `Color.diff`
+HSL_DIFF_WEIGHTS:np.ndarray = np.array([2, 1, 1])
+
+
+def nearest_lego(colors_hsl:np.ndarray, chunk_size:int = 4096) -> np.ndarray:
+    """ Finds the closest lego color to each of many colors at once, using the same difference as `Color.diff`.
+    
+    The colors are compared in chunks, so that the intermediate (chunk, N, 3) difference array stays small.
+
+    :param colors_hsl: The colors to match, as an array of normalized HSL values with a last dimension of 3.
+    :type colors_hsl: np.ndarray
+    :param chunk_size: The amount of colors compared at once, defaults to 4096
+    :type chunk_size: int, optional
+    :return: The index in `LEGO_COLORS_LIST` of the closest lego color, for each of the colors.
+    :rtype: np.ndarray
+    """
+    
+    colors_hsl = np.asarray(colors_hsl).reshape(-1, 3)
+    indices = np.empty(len(colors_hsl), dtype=np.intp)
+    
+    for start in range(0, len(colors_hsl), chunk_size):
+        differences = colors_hsl[start:start+chunk_size, None, :] - LEGO_COLORS_HSL[None, :, :]
+        
+        # The weighted sum of squares, without the square root as only the order of the differences matters
+        indices[start:start+chunk_size] = np.einsum("ijk,ijk,k->ij", differences, differences, HSL_DIFF_WEIGHTS).argmin(axis=1)
+    
+    return indices
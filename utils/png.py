@@ -0,0 +1,104 @@
+from pathlib import Path
+import struct, zlib
+
+import numpy as np
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+class PngWriter():
+    """ Writes an 8-bit RGBA PNG image one band of rows at a time.
+
+    Rows are compressed and written to the file as they are given, so only the band currently being
+    written has to be held in memory, rather than the whole image.
+    Every row is stored with the PNG "Up" filter (the difference to the row above it), which suits
+    the vertically repeating stud images well.
+    """
+
+    def __init__(self, path:Path|str, width:int, height:int, compress_level:int = 6):
+        """ Opens the file at the given path and writes the PNG header.
+
+        :param path: The path to write the image to.
+        :type path: Path | str
+        :param width: The width of the image, in pixels.
+        :type width: int
+        :param height: The height of the image, in pixels.
+        :type height: int
+        :param compress_level: The zlib compression level (0-9), defaults to 6
+        :type compress_level: int, optional
+        """
+
+        self.width:int = width
+        self.height:int = height
+        self.rows_written:int = 0
+
+        self.compressor = zlib.compressobj(compress_level)
+        self.previous_row:np.ndarray = np.zeros(width * 4, dtype=np.uint8)
+
+        self.file = open(path, "wb")
+        self.file.write(PNG_SIGNATURE)
+
+        # 8-bit depth, color type 6 (RGBA), and the default compression, filter and interlace methods
+        self.write_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+
+    def __enter__(self) -> "PngWriter":
+        """ Returns the writer, to be used as a context manager that closes the image when exited """
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """ Finishes the image, or if an exception was raised whilst writing, just closes the file """
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+
+    def write_chunk(self, chunk_type:bytes, data:bytes):
+        """ Writes a single PNG chunk, with its length and checksum.
+
+        :param chunk_type: The 4 character chunk type, eg b"IDAT".
+        :type chunk_type: bytes
+        :param data: The data of the chunk.
+        :type data: bytes
+        """
+        self.file.write(struct.pack(">I", len(data)))
+        self.file.write(chunk_type)
+        self.file.write(data)
+        self.file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type))))
+
+    def write_rows(self, rows:np.ndarray):
+        """ Filters, compresses and writes the next band of rows of the image.
+
+        :param rows: The rows to write, as a uint8 array of shape (band height, width, 4).
+        :type rows: np.ndarray
+
+        :raises AssertionError: If the rows are the wrong width, or there are more rows than the image height.
+        """
+
+        assert rows.shape[1:] == (self.width, 4), "Rows must be RGBA and the same width as the image"
+        assert self.rows_written + len(rows) <= self.height, "Cannot write more rows than the image height"
+
+        rows = rows.reshape(len(rows), -1)
+
+        # The first byte of each row is its filter type, 2 being "Up". uint8 subtraction wraps around, as the filter requires
+        filtered = np.empty((len(rows), rows.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 0] = 2
+        filtered[0, 1:] = rows[0] - self.previous_row
+        filtered[1:, 1:] = rows[1:] - rows[:-1]
+
+        self.previous_row = rows[-1].copy()
+        self.rows_written += len(rows)
+
+        data = self.compressor.compress(filtered)
+        if data:
+            self.write_chunk(b"IDAT", data)
+
+    def close(self):
+        """ Writes the remaining compressed data and the end of the image, and closes the file.
+
+        :raises AssertionError: If fewer rows were written than the image height.
+        """
+
+        assert self.rows_written == self.height, f"Only {self.rows_written} of {self.height} rows were written"
+
+        self.write_chunk(b"IDAT", self.compressor.flush())
+        self.write_chunk(b"IEND", b"")
+        self.file.close()